@@ -5,9 +5,17 @@
     Description: Trapezoidal map construction and planar point location implementation
 """
 
-import matplotlib.pyplot as plt
 import sys
 
+# Node kinds, stored on each node class as KIND so traversals can dispatch on an integer compare
+KIND_BP = 0
+KIND_EP = 1
+KIND_SEG = 2
+KIND_TRAP = 3
+
+# matplotlib backends that render to files only, plt.show() cannot open a window with these
+NON_INTERACTIVE_BACKENDS = ("agg", "cairo", "pdf", "pgf", "ps", "svg", "template")
+
 class Trapezoid:
     """
     This is a class for representing a trapezoid for planar point location
@@ -19,7 +27,11 @@ class Trapezoid:
         below_segment (Segment): the lower bounding line of the trapezoid
         parent (BeginPoint, EndPoint, or Segment): parent pointer as part of the graph structure for traversal
         name (string): name of the trapezoid
+        index (int): zero based number of the trapezoid, matching its name
     """
+    KIND = KIND_TRAP
+    __slots__ = ("left_point", "right_point", "above_segment", "below_segment", "parent", "name", "index")
+
     def __init__(self, left_p, right_p, above_seg, below_seg, parent):
         """
         The constructor for Trapezoid class
@@ -37,14 +49,16 @@ class Trapezoid:
         self.below_segment = below_seg
         self.parent = parent
 
-    def setName(self, name):
+    def setName(self, name, index):
         """
         Set the name of the trapezoid
 
         Parameters:
             name (string): name to be assigned to the trapezoid
+            index (int): zero based number of the trapezoid, matching its name
         """
         self.name = name
+        self.index = index
 
     def __str__(self):
         """
@@ -68,6 +82,8 @@ class Trapezoid:
         Returns:
             Boolean: True if other is equal to this trapezoid, False otherwise
         """
+        if other is self:
+            return True
         if isinstance(other, self.__class__):
             return self.left_point == other.left_point and \
                 self.right_point == other.right_point and \
@@ -87,10 +103,16 @@ class Segment:
         p (BeginPoint): beginning point for this segment or left end point
         q (EndPoint): ending point for this segment or right end point
         name (string): name of the segment
+        index (int): zero based number of the segment, matching its name
         m (float): slope of the segment
         b (float): y-intercept of the segment
+        dx (float): change in x from p to q, used for division free side tests
+        dy (float): change in y from p to q, used for division free side tests
     """
-    def __init__(self, left_point, right_point, parent, next_seg):
+    KIND = KIND_SEG
+    __slots__ = ("parent", "above", "below", "p", "q", "name", "index", "m", "b", "dx", "dy")
+
+    def __init__(self, left_point, right_point, parent, next_seg, m = None, b = None):
         """
         The constructor for Segment class
 
@@ -99,6 +121,8 @@ class Segment:
             right_point (EndPoint): ending point for this segment or right end point
             parent (BeginPoint, EndPoint, or Segment): parent pointer as part of the graph structure for traversal
             next_seg (int): number representing the id of the segment used for constructing the name
+            m (float): precomputed slope of the segment, calculated from the end points if not given
+            b (float): precomputed y-intercept of the segment, calculated from the end points if not given
         """
         self.parent = parent
         self.above = None
@@ -106,8 +130,18 @@ class Segment:
         self.p = left_point
         self.q = right_point
         self.name = "S" + str(next_seg)
-        self.m = (self.q.loc[1] - self.p.loc[1]) / (self.q.loc[0] - self.p.loc[0])
-        self.b = (self.p.loc[1] - (self.p.loc[0] * self.m))
+        self.index = next_seg - 1
+        p_x = left_point.x
+        p_y = left_point.y
+        dx = right_point.x - p_x
+        dy = right_point.y - p_y
+        self.dx = dx
+        self.dy = dy
+        if m is None:
+            m = dy / dx
+            b = p_y - (p_x * m)
+        self.m = m
+        self.b = b
 
     def __str__(self):
         """
@@ -130,6 +164,21 @@ class Segment:
         """
         return self.m*x + self.b
 
+    def side(self, x, y):
+        """
+        Orientation test for a point against the segment, the cross product of p->q and p->(x, y).
+        Every side test in the map goes through this sign so construction and point location agree,
+        it is exact for integer input where comparing y with m*x + b can round either way
+
+        Parameters:
+            x (float): x coordinate of the point
+            y (float): y coordinate of the point
+
+        Returns:
+            float: positive if the point is above the segment, 0 if it is on it, negative if below
+        """
+        return self.dx*(y - self.p.y) - self.dy*(x - self.p.x)
+
     def isAbove(self, other):
         """
         Given a planar point location object, check to see if it is above the segment
@@ -140,15 +189,16 @@ class Segment:
         Returns:
             Boolean: True if other is above, else False
         """
-        if isinstance(other, EndPoint) or isinstance(other, BeginPoint):
-            return self.getY(other.loc[0]) > other.loc[1]
-        elif isinstance(other, Segment):
-            if self.getY(other.p.loc[0]) == other.p.loc[1]:
+        kind = other.KIND
+        if kind <= KIND_EP:
+            return self.side(other.x, other.y) < 0
+        elif kind == KIND_SEG:
+            if self.side(other.p.x, other.p.y) == 0:
                 # check other point
-                return self.getY(other.q.loc[0]) > other.q.loc[1]
-            return self.getY(other.p.loc[0]) > other.p.loc[1]
-        else:   #Its a trap!
-            return self.getY(other.above_segment.p.loc[0]) > other.above_segment.p.loc[1]
+                return self.side(other.q.x, other.q.y) < 0
+            return self.side(other.p.x, other.p.y) < 0
+        elif kind == KIND_TRAP:
+            return self.side(other.above_segment.p.x, other.above_segment.p.y) < 0
     
     def isOn(self, other):
         """
@@ -160,12 +210,13 @@ class Segment:
         Returns:
             Boolean: True if the other object lies on the segment, False otherwise
         """
-        if isinstance(other, EndPoint) or isinstance(other, BeginPoint):
-            return self.getY(other.loc[0]) == other.loc[1]
-        elif isinstance(other, Segment):
-            return self.getY(other.p.loc[0]) == other.p.loc[1]
-        else:
-            return self.getY(other.above_segment.p.loc[0]) == other.above_segment.p.loc[1]
+        kind = other.KIND
+        if kind <= KIND_EP:
+            return self.side(other.x, other.y) == 0
+        elif kind == KIND_SEG:
+            return self.side(other.p.x, other.p.y) == 0
+        elif kind == KIND_TRAP:
+            return self.side(other.above_segment.p.x, other.above_segment.p.y) == 0
 
     def __eq__(self, other):
         """
@@ -177,11 +228,22 @@ class Segment:
         Returns:
             Boolean: True if other is equal to this segment, False otherwise
         """
+        if other is self:
+            return True
         if isinstance(other, self.__class__):
             return self.name == other.name
         else:
             return False
 
+    def __hash__(self):
+        """
+        Hashes the segment by name, consistent with __eq__
+
+        Returns:
+            int: hash of the segment's name
+        """
+        return hash(self.name)
+
     def replaceChild(self, oldChild, newChild):
         """
         Replaces oldChild with newChild
@@ -204,11 +266,15 @@ class BeginPoint:
         parent (BeginPoint, EndPoint, or Segment): parent pointer as part of the graph structure for traversal
         left (BeginPoint, EndPoint, or Segment): planar point location object that is spatially to the left of this point
         right (BeginPoint, EndPoint, or Segment): planar point location object that is spatially to the right of this point
-        loc (list): x and y coordinate of point
+        x (float): x coordinate of point
+        y (float): y coordinate of point
         name (string): name of the point
+        index (int): zero based number of the point, matching its name
+        bullet_upper (float): y coordinate where the upward bullet path from this point is trimmed
+        bullet_lower (float): y coordinate where the downward bullet path from this point is trimmed
     """
-    bullet_upper = 100
-    bullet_lower = 0
+    KIND = KIND_BP
+    __slots__ = ("parent", "left", "right", "x", "y", "name", "index", "bullet_upper", "bullet_lower")
 
     def __init__(self, x, y, parent, next_pt):
         """
@@ -223,8 +289,12 @@ class BeginPoint:
         self.parent = parent
         self.left = None
         self.right = None
-        self.loc = [x, y]
+        self.x = x
+        self.y = y
         self.name = "P" + str(next_pt)
+        self.index = next_pt - 1
+        self.bullet_upper = 100
+        self.bullet_lower = 0
     
     def __str__(self):
         """
@@ -256,11 +326,15 @@ class EndPoint:
         parent (BeginPoint, EndPoint, or Segment): parent pointer as part of the graph structure for traversal
         left (BeginPoint, EndPoint, or Segment): planar point location object that is spatially to the left of this point
         right (BeginPoint, EndPoint, or Segment): planar point location object that is spatially to the right of this point
-        loc (list): x and y coordinate of point
+        x (float): x coordinate of point
+        y (float): y coordinate of point
         name (string): name of the point
+        index (int): zero based number of the point, matching its name
+        bullet_upper (float): y coordinate where the upward bullet path from this point is trimmed
+        bullet_lower (float): y coordinate where the downward bullet path from this point is trimmed
     """
-    bullet_upper = 100
-    bullet_lower = 0
+    KIND = KIND_EP
+    __slots__ = ("parent", "left", "right", "x", "y", "name", "index", "bullet_upper", "bullet_lower")
 
     def __init__(self, x, y, parent, next_pt):
         """
@@ -275,8 +349,12 @@ class EndPoint:
         self.parent = parent
         self.left = None
         self.right = None
-        self.loc = [x, y]
+        self.x = x
+        self.y = y
         self.name = "Q" + str(next_pt)
+        self.index = next_pt - 1
+        self.bullet_upper = 100
+        self.bullet_lower = 0
     
     def __str__(self):
         """
@@ -300,7 +378,7 @@ class EndPoint:
         elif self.right == oldChild:
             self.right = newChild
 
-def construct_trapezoidal_map(lines, bound_box):
+def construct_trapezoidal_map(lines, bound_box, verbose=False):
     """
     This function constructs the acyclic graph representing the trapezoidal map. Given line segments
     and a bounding box, lines are inserted into the graph incrementally, creating the trapezoidal map after
@@ -309,6 +387,7 @@ def construct_trapezoidal_map(lines, bound_box):
     Parameters:
         lines (list): list of segments represented as a left end point and right end point
         bound_box (list): list containing lower left and upper right point of the bounding box
+        verbose (bool): write each segment to stdout as it is added
 
     Returns:
         the root node of the acyclic graph representation of the trapezoidal map
@@ -328,7 +407,8 @@ def construct_trapezoidal_map(lines, bound_box):
     the_tree = Trapezoid(bb_bot_p, bb_top_q, bb_top_s, bb_bot_s, None)
 
     for line in lines:
-        #print("Adding " + str(line))
+        if verbose:
+            print(f"Adding {line}")
         #debugPrintTree(the_tree)
         #construct_map_plot(the_tree)
         
@@ -340,12 +420,19 @@ def construct_trapezoidal_map(lines, bound_box):
         next_point += 1 
         next_segment += 1
 
+        # Slope and intercept shared by every Segment made for this line
+        if line[1][0] != line[0][0]:
+            line_m = (line[1][1] - line[0][1]) / (line[1][0] - line[0][0])
+            line_b = (line[0][1] - (line[0][0] * line_m))
+        else:
+            line_m = line_b = None
+
         # CASE 2: Both endpoints are in the same trapezoid
         if t_p == t_q:
             # P will be Q's parent
             p = BeginPoint(line[0][0], line[0][1], t_p.parent, next_point)
             q = EndPoint(line[1][0], line[1][1], p, next_point)
-            s = Segment(p, q, q, next_segment)
+            s = Segment(p, q, q, next_segment, line_m, line_b)
 
             # Add trapezoid for P.left
             p.left = Trapezoid(t_p.left_point, p, t_p.above_segment, t_p.below_segment, p)
@@ -373,7 +460,7 @@ def construct_trapezoidal_map(lines, bound_box):
             duplicate_p = False
             duplicate_q = False
             # CASE 1 FOR BOTH ENDPOINTS since P and Q have different parents
-            if isinstance(t_p, BeginPoint) or isinstance(t_p, EndPoint):
+            if t_p.KIND <= KIND_EP:
                 # P is a duplicate point
                 duplicate_p = True
                 #print("P is a duplicate point!")    # Wow, P sure is special
@@ -384,7 +471,7 @@ def construct_trapezoidal_map(lines, bound_box):
                 t_p.parent.replaceChild(t_p, p)
 
 
-            if isinstance(t_q, BeginPoint) or isinstance(t_q, EndPoint):
+            if t_q.KIND <= KIND_EP:
                 # Q is a duplicate point...
                 duplicate_q = True
                 #print("Q is a duplicate point!")    # Tell the world how special Q is
@@ -397,77 +484,96 @@ def construct_trapezoidal_map(lines, bound_box):
             if not duplicate_p:
                 # Normal handling of P
                 # Add segment for P.right
-                s = Segment(p, q, p, next_segment)
+                s = Segment(p, q, p, next_segment, line_m, line_b)
                 p.right = s
 
                 # Add Trapezoid for P.left
                 p.left = Trapezoid(t_p.left_point, p, t_p.above_segment, t_p.below_segment, p)
 
-                # Add Trapezoids for S.above and S.below
-                if isinstance(t_p.parent, BeginPoint) and t_p.parent.loc[1] >= s.getY(t_p.parent.loc[0]):
+                # Add Trapezoids for S.above and S.below, the side test against the parent is evaluated once
+                parent = t_p.parent
+                parent_kind = parent.KIND
+                if parent_kind == KIND_BP:
+                    parent_above = s.side(parent.x, parent.y) >= 0
+                elif parent_kind == KIND_SEG:
+                    parent_above = parent.side(p.x, p.y) >= 0
+
+                if parent_kind == KIND_BP and parent_above:
                     s.above = Trapezoid(p, t_p.right_point, t_p.above_segment, s, s)
-                    t_p.right_point.bullet_lower = s.getY(t_p.right_point.loc[0])
+                    t_p.right_point.bullet_lower = s.m*t_p.right_point.x + s.b
                     s.below = Trapezoid(p, findRightPointBelow(the_tree, s), s, t_p.below_segment, s)
 
-                elif isinstance(t_p.parent, BeginPoint) and t_p.parent.loc[1] < s.getY(t_p.parent.loc[0]):
+                elif parent_kind == KIND_BP and not parent_above:
                     s.above = Trapezoid(p, findRightPointAbove(the_tree, s), t_p.above_segment, s, s)
                     s.below = Trapezoid(p, t_p.right_point, s, t_p.below_segment, s)
-                    t_p.right_point.bullet_upper = s.getY(t_p.right_point.loc[0])
+                    t_p.right_point.bullet_upper = s.m*t_p.right_point.x + s.b
 
-                elif isinstance(t_p.parent, Segment) and p.loc[1] >= t_p.parent.getY(p.loc[0]):
+                elif parent_kind == KIND_SEG and parent_above:
                     s.above = Trapezoid(p, findRightPointAbove(the_tree, s), t_p.above_segment, s, s)
                     s.below = Trapezoid(p, t_p.right_point, s, t_p.below_segment, s)
-                    t_p.right_point.bullet_upper = s.getY(t_p.right_point.loc[0])
+                    t_p.right_point.bullet_upper = s.m*t_p.right_point.x + s.b
 
-                elif isinstance(t_p.parent, Segment) and p.loc[1] < t_p.parent.getY(p.loc[0]):
+                elif parent_kind == KIND_SEG and not parent_above:
                     s.above = Trapezoid(p, t_p.right_point, t_p.above_segment, s, s)
-                    t_p.right_point.bullet_lower = s.getY(t_p.right_point.loc[0])
+                    t_p.right_point.bullet_lower = s.m*t_p.right_point.x + s.b
                     s.below = Trapezoid(p, findRightPointBelow(the_tree, s), s, t_p.below_segment, s)
 
 
             if not duplicate_q:
                 # Normal handling of Q's segment
                 # Add segment for Q.left
-                s = Segment(p, q, q, next_segment)
+                s = Segment(p, q, q, next_segment, line_m, line_b)
                 q.left = s
 
                 # Add Trapezoid for Q.right
                 q.right = Trapezoid(q, t_q.right_point, t_q.above_segment, t_q.below_segment, q)
 
-                # Add Trapezoids for S.above and S.below
-                if isinstance(t_q.parent, EndPoint) and t_q.parent.loc[1] >= s.getY(t_q.parent.loc[0]):
+                # Add Trapezoids for S.above and S.below, the side test against the parent is evaluated once
+                parent = t_q.parent
+                parent_kind = parent.KIND
+                if parent_kind == KIND_EP:
+                    parent_above = s.side(parent.x, parent.y) >= 0
+                elif parent_kind == KIND_SEG:
+                    parent_above = parent.side(p.x, p.y) >= 0
+
+                if parent_kind == KIND_EP and parent_above:
                     s.above = Trapezoid(t_q.left_point, q, t_q.above_segment, s, s)
-                    t_q.left_point.bullet_lower = s.getY(t_q.left_point.loc[0])
+                    t_q.left_point.bullet_lower = s.m*t_q.left_point.x + s.b
                     s.below = Trapezoid(findLeftPointBelow(the_tree, s), q, s, t_q.below_segment, s)
 
-                elif isinstance(t_q.parent, EndPoint) and t_q.parent.loc[1] < s.getY(t_q.parent.loc[0]):
+                elif parent_kind == KIND_EP and not parent_above:
                     s.above = Trapezoid(findLeftPointAbove(the_tree, s), q, t_q.above_segment, s, s)
                     s.below = Trapezoid(t_q.left_point, q, s, t_q.below_segment, s)
-                    t_q.left_point.bullet_upper = s.getY(t_q.left_point.loc[0])
+                    t_q.left_point.bullet_upper = s.m*t_q.left_point.x + s.b
 
-                elif isinstance(t_q.parent, Segment) and p.loc[1] >= t_q.parent.getY(p.loc[0]):
+                elif parent_kind == KIND_SEG and parent_above:
                     s.above = Trapezoid(findLeftPointAbove(the_tree, s), q, t_q.above_segment, s, s)
                     s.below = Trapezoid(t_q.left_point, q, s, t_q.below_segment, s)
-                    t_q.left_point.bullet_upper = s.getY(t_q.left_point.loc[0])
+                    t_q.left_point.bullet_upper = s.m*t_q.left_point.x + s.b
 
-                elif isinstance(t_q.parent, Segment) and p.loc[1] < t_q.parent.getY(p.loc[0]):
+                elif parent_kind == KIND_SEG and not parent_above:
                     s.above = Trapezoid(t_q.left_point, q, t_q.above_segment, s, s)
                     s.below = Trapezoid(findLeftPointBelow(the_tree, s), q, s, t_q.below_segment, s)
-                    t_q.left_point.bullet_lower = s.getY(t_q.left_point.loc[0])
+                    t_q.left_point.bullet_lower = s.m*t_q.left_point.x + s.b
 
             # CASE 3   :(
-            high_trap = Trapezoid(p, q, bb_top_s, Segment(p, q, None, next_segment), None)
-            low_trap = Trapezoid(p, q, Segment(p, q, None, next_segment), bb_bot_s, None)
+            line_seg = Segment(p, q, None, next_segment, line_m, line_b)
+            high_trap = Trapezoid(p, q, bb_top_s, line_seg, None)
+            low_trap = Trapezoid(p, q, line_seg, bb_bot_s, None)
             blockBullets(the_tree, p, q, high_trap, low_trap, next_segment, duplicate_p, duplicate_q)
             
 
         # Update bullet paths for P and Q
         if not duplicate_p:
-            p.bullet_upper = t_p.above_segment.getY(p.loc[0])
-            p.bullet_lower = t_p.below_segment.getY(p.loc[0])
+            x = p.x
+            above, below = t_p.above_segment, t_p.below_segment
+            p.bullet_upper = above.m*x + above.b
+            p.bullet_lower = below.m*x + below.b
         if not duplicate_q:
-            q.bullet_upper = t_q.above_segment.getY(q.loc[0])
-            q.bullet_lower = t_q.below_segment.getY(q.loc[0])
+            x = q.x
+            above, below = t_q.above_segment, t_q.below_segment
+            q.bullet_upper = above.m*x + above.b
+            q.bullet_lower = below.m*x + below.b
 
     #print("ALL DONE(?)")
     #debugPrintTree(the_tree)
@@ -480,18 +586,20 @@ def debugPrintTree(tree, offset = ""):
     """
     if tree is None:
         print(offset + "D'OH!")
+        return
     else:
         print(offset + str(tree))
         if len(offset) % 2 == 0:
             offset = offset + "|"
         else:
             offset = offset + " "
-    if isinstance(tree, BeginPoint) or isinstance(tree, EndPoint):
+    kind = tree.KIND
+    if kind <= KIND_EP:
         print(offset + "left:")
         debugPrintTree(tree.left, offset)
         print(offset + "right:")
         debugPrintTree(tree.right, offset)
-    if isinstance(tree, Segment):
+    if kind == KIND_SEG:
         print(offset + "above:")
         debugPrintTree(tree.above, offset)
         print(offset + "below:")
@@ -501,106 +609,130 @@ def blockBullets(tree, left_point, right_point, high_trap, low_trap, seg_name, h
     """
 
     """
-    #print("blocking at " + str(tree))
-    if isinstance(tree, Trapezoid):
-        s = Segment(left_point, right_point, tree.parent, seg_name)
-        # Determine sides of new trapezoids, trimming bullet paths accordingly
-        if s.isAbove(tree.left_point):
-            above_left = high_trap.left_point
-            below_left = tree.left_point
-            if not s.isOn(tree.left_point):
-                tree.left_point.bullet_upper = s.getY(tree.left_point.loc[0])
-        else:
-            above_left = tree.left_point
-            below_left = low_trap.left_point
-            if not s.isOn(tree.left_point):
-                tree.left_point.bullet_lower = s.getY(tree.left_point.loc[0])
-
-        if s.isAbove(tree.right_point):
-            above_right = high_trap.right_point
-            below_right = tree.right_point
-            if not s.isOn(tree.right_point):
-                tree.right_point.bullet_upper = s.getY(tree.right_point.loc[0])
-        else:
-            above_right = tree.right_point
-            below_right = low_trap.right_point
-            if not s.isOn(tree.right_point):
-                tree.right_point.bullet_lower = s.getY(tree.right_point.loc[0])
-
-        # Make the new trapezoids
-        s.above = Trapezoid(above_left, above_right, high_trap.above_segment, s, s)
-        s.below = Trapezoid(below_left, below_right, s, low_trap.below_segment, s)
-
-        # Gotta insert the new segment
-        tree.parent.replaceChild(tree, s)
-
-    elif isinstance(tree, Segment):
-        # if new segment is above
-        if tree.isAbove(left_point):
-            # Shrink high_trap
-            short_high_trap = Trapezoid(rightMostPoint(high_trap.left_point, tree.p), leftMostPoint(high_trap.right_point, tree.q), tree, high_trap.below_segment, None)
-            blockBullets(tree.below, left_point, right_point, short_high_trap, low_trap, seg_name, handleLeftDupes, handleRightDupes)
-        else:
-            # Shrink low_trap
-            short_low_trap = Trapezoid(rightMostPoint(low_trap.left_point, tree.p), leftMostPoint(low_trap.right_point, tree.q), low_trap.above_segment, tree, None)
-            blockBullets(tree.above, left_point, right_point, high_trap, short_low_trap, seg_name, handleLeftDupes, handleRightDupes)
-
-    else: # tree is a point
-        if (handleLeftDupes == False and tree == left_point) or (handleRightDupes == False and tree == right_point):
-            return # Don't bother going deeper when we hit our own endpoints
-        if tree.loc[0] <= left_point.loc[0]:
-            # Just traverse right
-            blockBullets(tree.right, left_point, right_point, high_trap, low_trap, seg_name, handleLeftDupes, handleRightDupes)
-        elif tree.loc[0] >= right_point.loc[0]:
-            # Just traverse left
-            blockBullets(tree.left, left_point, right_point, high_trap, low_trap, seg_name, handleLeftDupes, handleRightDupes)
-        else:
-            # Split the recursion, traverse both directions, and update bullet paths
-            s = Segment(left_point, right_point, None, "_")    # For calculations, not actually saved in the tree
-            if s.isAbove(tree):
-                # Split lower trapezoid and traverse both directions
-                low_trap_left = Trapezoid(low_trap.left_point, tree, s, low_trap.below_segment, s)
-                low_trap_right = Trapezoid(tree, low_trap.right_point, s, low_trap.below_segment, s)
-                blockBullets(tree.left, left_point, right_point, high_trap, low_trap_left, seg_name, handleLeftDupes, handleRightDupes)
-                blockBullets(tree.right, left_point, right_point, high_trap, low_trap_right, seg_name, handleLeftDupes, handleRightDupes)
+    # Explicit stack of (node, high_trap, low_trap, go_right), a point's right child is read after its left side
+    stack = [(tree, high_trap, low_trap, False)]
+    while stack:
+        tree, high_trap, low_trap, go_right = stack.pop()
+        if go_right:
+            tree = tree.right
+        #print("blocking at " + str(tree))
+        kind = tree.KIND
+        if kind == KIND_TRAP:
+            # high_trap is always bounded below by a segment of the line being inserted, reuse its slope
+            s = Segment(left_point, right_point, tree.parent, seg_name, high_trap.below_segment.m, high_trap.below_segment.b)
+            # Determine sides of new trapezoids, trimming bullet paths accordingly
+            tree_left = tree.left_point
+            side = s.side(tree_left.x, tree_left.y)
+            if side < 0:
+                above_left = high_trap.left_point
+                below_left = tree_left
+                tree_left.bullet_upper = s.m*tree_left.x + s.b
             else:
-                # Split higher trapezoid and traverse both directions
-                high_trap_left = Trapezoid(high_trap.left_point, tree, high_trap.above_segment, s, s)
-                high_trap_right = Trapezoid(tree, high_trap.right_point, high_trap.above_segment, s, s)
-                blockBullets(tree.left, left_point, right_point, high_trap_left, low_trap, seg_name, handleLeftDupes, handleRightDupes)
-                blockBullets(tree.right, left_point, right_point, high_trap_right, low_trap, seg_name, handleLeftDupes, handleRightDupes)
-        
+                above_left = tree_left
+                below_left = low_trap.left_point
+                if side != 0:
+                    tree_left.bullet_lower = s.m*tree_left.x + s.b
+
+            tree_right = tree.right_point
+            side = s.side(tree_right.x, tree_right.y)
+            if side < 0:
+                above_right = high_trap.right_point
+                below_right = tree_right
+                tree_right.bullet_upper = s.m*tree_right.x + s.b
+            else:
+                above_right = tree_right
+                below_right = low_trap.right_point
+                if side != 0:
+                    tree_right.bullet_lower = s.m*tree_right.x + s.b
+
+            # Make the new trapezoids
+            s.above = Trapezoid(above_left, above_right, high_trap.above_segment, s, s)
+            s.below = Trapezoid(below_left, below_right, s, low_trap.below_segment, s)
+
+            # Gotta insert the new segment
+            tree.parent.replaceChild(tree, s)
+
+        elif kind == KIND_SEG:
+            # if new segment is above
+            if tree.isAbove(left_point):
+                # Shrink high_trap
+                short_high_trap = Trapezoid(rightMostPoint(high_trap.left_point, tree.p), leftMostPoint(high_trap.right_point, tree.q), tree, high_trap.below_segment, None)
+                stack.append((tree.below, short_high_trap, low_trap, False))
+            else:
+                # Shrink low_trap
+                short_low_trap = Trapezoid(rightMostPoint(low_trap.left_point, tree.p), leftMostPoint(low_trap.right_point, tree.q), low_trap.above_segment, tree, None)
+                stack.append((tree.above, high_trap, short_low_trap, False))
+
+        else: # tree is a point
+            if (not handleLeftDupes and tree is left_point) or (not handleRightDupes and tree is right_point):
+                continue # Don't bother going deeper when we hit our own endpoints
+            if tree.x <= left_point.x:
+                # Just traverse right
+                stack.append((tree.right, high_trap, low_trap, False))
+            elif tree.x >= right_point.x:
+                # Just traverse left
+                stack.append((tree.left, high_trap, low_trap, False))
+            else:
+                # Split the recursion, traverse both directions, and update bullet paths
+                s = high_trap.below_segment
+                if s.isAbove(tree):
+                    # Split lower trapezoid and traverse both directions
+                    low_trap_left = Trapezoid(low_trap.left_point, tree, s, low_trap.below_segment, s)
+                    low_trap_right = Trapezoid(tree, low_trap.right_point, s, low_trap.below_segment, s)
+                    stack.append((tree, high_trap, low_trap_right, True))
+                    stack.append((tree.left, high_trap, low_trap_left, False))
+                else:
+                    # Split higher trapezoid and traverse both directions
+                    high_trap_left = Trapezoid(high_trap.left_point, tree, high_trap.above_segment, s, s)
+                    high_trap_right = Trapezoid(tree, high_trap.right_point, high_trap.above_segment, s, s)
+                    stack.append((tree, high_trap_right, low_trap, True))
+                    stack.append((tree.left, high_trap_left, low_trap, False))
+
 
 def findLeftPointAbove(cur, seg):    
     """
     When constructing a trapezoid, this function figures out the left bound vertex relative to
     the trapezoid above the segment we are looking at
     """
-    # ANY POINT IS FAIR GAME
-    if isinstance(cur, BeginPoint) or isinstance(cur, EndPoint):
-        # if cur.x > q.x
-        if cur.loc[0] > seg.q.loc[0]:
-            # Just look left
-            return findLeftPointAbove(cur.left, seg)
-        elif cur == seg.q:
-            return None
-        elif cur == seg.p:
-            return seg.p
-        else:
-            r = findLeftPointAbove(cur.right, seg)
-            l = findLeftPointAbove(cur.left, seg)
-            if not seg.isAbove(cur): # if cur is above seg include it
-                return rightMostPoint(l, r, cur)
-            else:   # otherwise just check l and r
-                return rightMostPoint(l, r)
-    elif isinstance(cur, Segment):
-        if cur.isAbove(seg):
-            return findLeftPointAbove(cur.below, seg)
-        else:
-            return findLeftPointAbove(cur.above, seg)
-    else:
-        # It's a trap!
-        return None
+    # Explicit stack, visits left, right, then the point itself
+    seg_q_x = seg.q.x
+    seg_x = seg.p.x
+    seg_y = seg.p.y
+    seg_dx = seg.dx
+    seg_dy = seg.dy
+    best = None
+    stack = [(cur, False)]
+    while stack:
+        cur, is_candidate = stack.pop()
+        if is_candidate:
+            # Both subtrees of cur are done, on a tie the point found first wins
+            if best is None or cur.x > best.x:
+                best = cur
+            continue
+        if cur is None:
+            continue
+        kind = cur.KIND
+        # ANY POINT IS FAIR GAME
+        if kind <= KIND_EP:
+            # if cur.x > q.x
+            if cur.x > seg_q_x:
+                # Just look left
+                stack.append((cur.left, False))
+            elif cur is seg.q:
+                continue
+            elif cur is seg.p:
+                stack.append((cur, True))
+            else:
+                if seg_dx*(cur.y - seg_y) - seg_dy*(cur.x - seg_x) >= 0: # if cur is above seg include it
+                    stack.append((cur, True))
+                stack.append((cur.right, False))
+                stack.append((cur.left, False))
+        elif kind == KIND_SEG:
+            if cur.isAbove(seg):
+                stack.append((cur.below, False))
+            else:
+                stack.append((cur.above, False))
+    return best
 
 
 def findLeftPointBelow(cur, seg):    
@@ -608,31 +740,45 @@ def findLeftPointBelow(cur, seg):
     When constructing a trapezoid, this function figures out the left bound vertex relative to
     the trapezoid below the segment we are looking at
     """
-    # ANY POINT IS FAIR GAME
-    if isinstance(cur, BeginPoint) or isinstance(cur, EndPoint):
-        # if cur.x > q.x
-        if cur.loc[0] > seg.q.loc[0]:
-            # Just look left
-            return findLeftPointBelow(cur.left, seg)
-        elif cur == seg.q:
-            return None
-        elif cur == seg.p:
-            return seg.p
-        else:
-            r = findLeftPointBelow(cur.right, seg)
-            l = findLeftPointBelow(cur.left, seg)
-            if seg.isAbove(cur): # if cur is below seg include it
-                return rightMostPoint(l, r, cur)
-            else:   # otherwise just check l and r
-                return rightMostPoint(l, r)
-    elif isinstance(cur, Segment):
-        if cur.isAbove(seg):
-            return findLeftPointBelow(cur.below, seg)
-        else:
-            return findLeftPointBelow(cur.above, seg)
-    else:
-        # cur is a trapezoid, ignore it
-        return None
+    # Same walk as findLeftPointAbove
+    seg_q_x = seg.q.x
+    seg_x = seg.p.x
+    seg_y = seg.p.y
+    seg_dx = seg.dx
+    seg_dy = seg.dy
+    best = None
+    stack = [(cur, False)]
+    while stack:
+        cur, is_candidate = stack.pop()
+        if is_candidate:
+            # Both subtrees of cur are done, on a tie the point found first wins
+            if best is None or cur.x > best.x:
+                best = cur
+            continue
+        if cur is None:
+            continue
+        kind = cur.KIND
+        # ANY POINT IS FAIR GAME
+        if kind <= KIND_EP:
+            # if cur.x > q.x
+            if cur.x > seg_q_x:
+                # Just look left
+                stack.append((cur.left, False))
+            elif cur is seg.q:
+                continue
+            elif cur is seg.p:
+                stack.append((cur, True))
+            else:
+                if seg_dx*(cur.y - seg_y) - seg_dy*(cur.x - seg_x) < 0: # if cur is below seg include it
+                    stack.append((cur, True))
+                stack.append((cur.right, False))
+                stack.append((cur.left, False))
+        elif kind == KIND_SEG:
+            if cur.isAbove(seg):
+                stack.append((cur.below, False))
+            else:
+                stack.append((cur.above, False))
+    return best
 
 
 def rightMostPoint(left, right, cur = None):
@@ -640,9 +786,9 @@ def rightMostPoint(left, right, cur = None):
     compares two points and checks to see which point is the closest to cur, but is to the right as well
     """
     bestPoint = left
-    if (bestPoint is None) or ((not right is None) and (bestPoint.loc[0] < right.loc[0])):
+    if (bestPoint is None) or ((not right is None) and (bestPoint.x < right.x)):
         bestPoint = right
-    if (bestPoint is None) or ((not cur is None) and (bestPoint.loc[0] < cur.loc[0])):
+    if (bestPoint is None) or ((not cur is None) and (bestPoint.x < cur.x)):
         bestPoint = cur
     return bestPoint
 
@@ -651,32 +797,45 @@ def findRightPointAbove(cur, seg):
     """
     When constructing a trapezoid, this function figures out the right bound vertex relative to
     the trapezoid above the segment we are looking at
-    """ 
-    # ANY POINT IS FAIR GAME
-    if isinstance(cur, BeginPoint) or isinstance(cur, EndPoint):
-        # if cur.x < p.x
-        if cur.loc[0] < seg.p.loc[0]:
-            # Just look right
-            return findRightPointAbove(cur.right, seg)
-        elif cur == seg.q:
-            return seg.q
-        elif cur == seg.p:
-            return None
-        else:
-            r = findRightPointAbove(cur.right, seg)
-            l = findRightPointAbove(cur.left, seg)
-            if not seg.isAbove(cur): # if cur is above seg include it
-                return leftMostPoint(l, r, cur)
-            else:   # otherwise just check l and r
-                return leftMostPoint(l, r)
-    elif isinstance(cur, Segment):
-        if cur.isAbove(seg):
-            return findRightPointAbove(cur.below, seg)
-        else:
-            return findRightPointAbove(cur.above, seg)
-    else:
-        # It's a trap!
-        return None
+    """   
+    # Explicit stack, visits left, right, then the point itself
+    seg_p_x = seg.p.x
+    seg_y = seg.p.y
+    seg_dx = seg.dx
+    seg_dy = seg.dy
+    best = None
+    stack = [(cur, False)]
+    while stack:
+        cur, is_candidate = stack.pop()
+        if is_candidate:
+            # Both subtrees of cur are done, on a tie the point found first wins
+            if best is None or cur.x < best.x:
+                best = cur
+            continue
+        if cur is None:
+            continue
+        kind = cur.KIND
+        # ANY POINT IS FAIR GAME
+        if kind <= KIND_EP:
+            # if cur.x < p.x
+            if cur.x < seg_p_x:
+                # Just look right
+                stack.append((cur.right, False))
+            elif cur is seg.q:
+                stack.append((cur, True))
+            elif cur is seg.p:
+                continue
+            else:
+                if seg_dx*(cur.y - seg_y) - seg_dy*(cur.x - seg_p_x) >= 0: # if cur is above seg include it
+                    stack.append((cur, True))
+                stack.append((cur.right, False))
+                stack.append((cur.left, False))
+        elif kind == KIND_SEG:
+            if cur.isAbove(seg):
+                stack.append((cur.below, False))
+            else:
+                stack.append((cur.above, False))
+    return best
 
 
 def findRightPointBelow(cur, seg):  
@@ -684,30 +843,44 @@ def findRightPointBelow(cur, seg):
     When constructing a trapezoid, this function figures out the right bound vertex relative to
     the trapezoid below the segment we are looking at
     """  
-    # ANY POINT IS FAIR GAME
-    if isinstance(cur, BeginPoint) or isinstance(cur, EndPoint):
-        # if cur.x < p.x
-        if cur.loc[0] < seg.p.loc[0]:
-            return findRightPointBelow(cur.right, seg)
-        elif cur == seg.q:
-            return seg.q
-        elif cur == seg.p:
-            return None
-        else:
-            r = findRightPointBelow(cur.right, seg)
-            l = findRightPointBelow(cur.left, seg)
-            if seg.isAbove(cur): # if cur is below seg include it
-                return leftMostPoint(l, r, cur)
-            else:   # otherwise just check l and r
-                return leftMostPoint(l, r)
-    elif isinstance(cur, Segment):
-        if cur.isAbove(seg):
-            return findRightPointBelow(cur.below, seg)
-        else:
-            return findRightPointBelow(cur.above, seg)
-    else:
-        # cur is a trapezoid, ignore it
-        return None
+    # Same walk as findRightPointAbove
+    seg_p_x = seg.p.x
+    seg_y = seg.p.y
+    seg_dx = seg.dx
+    seg_dy = seg.dy
+    best = None
+    stack = [(cur, False)]
+    while stack:
+        cur, is_candidate = stack.pop()
+        if is_candidate:
+            # Both subtrees of cur are done, on a tie the point found first wins
+            if best is None or cur.x < best.x:
+                best = cur
+            continue
+        if cur is None:
+            continue
+        kind = cur.KIND
+        # ANY POINT IS FAIR GAME
+        if kind <= KIND_EP:
+            # if cur.x < p.x
+            if cur.x < seg_p_x:
+                # Just look right
+                stack.append((cur.right, False))
+            elif cur is seg.q:
+                stack.append((cur, True))
+            elif cur is seg.p:
+                continue
+            else:
+                if seg_dx*(cur.y - seg_y) - seg_dy*(cur.x - seg_p_x) < 0: # if cur is below seg include it
+                    stack.append((cur, True))
+                stack.append((cur.right, False))
+                stack.append((cur.left, False))
+        elif kind == KIND_SEG:
+            if cur.isAbove(seg):
+                stack.append((cur.below, False))
+            else:
+                stack.append((cur.above, False))
+    return best
 
 
 def leftMostPoint(left, right, cur = None):
@@ -716,9 +889,9 @@ def leftMostPoint(left, right, cur = None):
     """
     bestPoint = left
     # if bp is none OR 
-    if (bestPoint is None) or ((not right is None) and (bestPoint.loc[0] > right.loc[0])):
+    if (bestPoint is None) or ((not right is None) and (bestPoint.x > right.x)):
         bestPoint = right
-    if (bestPoint is None) or ((not cur is None) and (bestPoint.loc[0] > cur.loc[0])):
+    if (bestPoint is None) or ((not cur is None) and (bestPoint.x > cur.x)):
         bestPoint = cur
     return bestPoint
 
@@ -727,159 +900,104 @@ def name_and_count_traps(trap_map, trap_set, cur_b_count, cur_e_count, cur_t_cou
     This function counts the number of BeginPoints, EndPoints (duplicate points will lower the count), and Trapezoids. 
     As well as, naming each unique trapezoid
     """
-    if isinstance(trap_map, BeginPoint):
-        left_b_count, left_e_count, cur_t_count = name_and_count_traps(trap_map.left, trap_set, cur_b_count, cur_e_count, cur_t_count)
-        right_b_count, right_e_count, right_t_count = name_and_count_traps(trap_map.right, trap_set, cur_b_count, cur_e_count, cur_t_count)
-        return (left_b_count + right_b_count + 1, left_e_count + right_e_count, right_t_count)
-    elif isinstance(trap_map, EndPoint):
-        left_b_count, left_e_count, cur_t_count = name_and_count_traps(trap_map.left, trap_set, cur_b_count, cur_e_count, cur_t_count)
-        right_b_count, right_e_count, right_t_count = name_and_count_traps(trap_map.right, trap_set, cur_b_count, cur_e_count, cur_t_count)
-        return (left_b_count + right_b_count, left_e_count + right_e_count + 1, right_t_count)
-    elif isinstance(trap_map, Segment):
-        left_b_count, left_e_count, cur_t_count = name_and_count_traps(trap_map.above, trap_set, cur_b_count, cur_e_count, cur_t_count)
-        right_b_count, right_e_count, right_t_count = name_and_count_traps(trap_map.below, trap_set, cur_b_count, cur_e_count, cur_t_count)
-        return (left_b_count + right_b_count, left_e_count + right_e_count, right_t_count)
-    else:
-        if trap_map in trap_set:
-            trap_map.setName(trap_set[trap_set.index(trap_map)].name)
-            return (cur_b_count, cur_e_count, cur_t_count)
+    # Explicit stack, left/above before right/below
+    find_trap = trap_set.get
+    stack = [trap_map]
+    pop = stack.pop
+    push = stack.append
+    while stack:
+        cur = pop()
+        kind = cur.KIND
+        if kind == KIND_BP:
+            cur_b_count += 1
+            push(cur.right)
+            push(cur.left)
+        elif kind == KIND_EP:
+            cur_e_count += 1
+            push(cur.right)
+            push(cur.left)
+        elif kind == KIND_SEG:
+            push(cur.below)
+            push(cur.above)
         else:
-            trap_map.setName("T"+str(cur_t_count+1))
-            trap_set.append(trap_map)
-            return (cur_b_count, cur_e_count, cur_t_count + 1)
+            # Same key Trapezoid.__eq__ compares on: points by identity, segments by name
+            key = (id(cur.left_point), id(cur.right_point), cur.above_segment.name, cur.below_segment.name)
+            match = find_trap(key)
+            if match is not None:
+                cur.setName(match.name, match.index)
+            else:
+                cur.setName("T"+str(cur_t_count+1), cur_t_count)
+                trap_set[key] = cur
+                cur_t_count += 1
+    return (cur_b_count, cur_e_count, cur_t_count)
 
-def populate_adjacency_matrix(trap_map, matrix, num_begin_points, num_end_points, num_lines):
+def populate_adjacency_matrix(trap_map, edges, num_begin_points, num_end_points, num_lines):
     """
-    This function converts a trapezoidal map (acyclic graph) into an adjacency matrix.
+    This function converts a trapezoidal map (acyclic graph) into the sparse (row, column) entries of
+    an adjacency matrix, adding them to the edges set.
     """
-    # Children adjacency addition
-    base_index = -1
-    left_index = -1
-    right_index = -1
-    above_index = -1
-    below_index = -1
-    if isinstance(trap_map, BeginPoint):
-        # Get Base index of current node
-        base_index = int(trap_map.name[1:]) - 1
-        # Get Left Child Index
-        if isinstance(trap_map.left, BeginPoint):
-            left_index = int(trap_map.left.name[1:]) - 1
-        elif isinstance(trap_map.left, EndPoint):
-            left_index = int(trap_map.left.name[1:]) + num_begin_points - 1
-        elif isinstance(trap_map.left, Segment):
-            left_index = int(trap_map.left.name[1:]) + num_begin_points + num_end_points - 1
-        else:
-            left_index = int(trap_map.left.name[1:]) + num_begin_points + num_end_points + num_lines - 1
-        # Get Right Child Index
-        if isinstance(trap_map.right, BeginPoint):
-            right_index = int(trap_map.right.name[1:]) - 1
-        elif isinstance(trap_map.right, EndPoint):
-            right_index = int(trap_map.right.name[1:]) + num_begin_points - 1
-        elif isinstance(trap_map.right, Segment):
-            right_index = int(trap_map.right.name[1:]) + num_begin_points + num_end_points - 1
+    # Matrix offset of each node kind, indexed by KIND: points, end points, segments, then trapezoids
+    offsets = (0, num_begin_points, num_begin_points + num_end_points, num_begin_points + num_end_points + num_lines)
+    add_edge = edges.add
+    stack = [trap_map]
+    while stack:
+        cur = stack.pop()
+        kind = cur.KIND
+        if kind == KIND_TRAP:
+            continue
+        if kind == KIND_SEG:
+            first, second = cur.above, cur.below
         else:
-            right_index = int(trap_map.right.name[1:]) + num_begin_points + num_end_points + num_lines - 1
+            first, second = cur.left, cur.right
+        # Get Base index of current node and its children
+        base_index = cur.index + offsets[kind]
+        first_index = first.index + offsets[first.KIND]
+        second_index = second.index + offsets[second.KIND]
 
         # Update Adjacency Matrix
-        matrix[left_index][base_index] = 1
-        matrix[right_index][base_index] = 1
+        add_edge((first_index, base_index))
+        add_edge((second_index, base_index))
 
         # Traverse down to the children
-        populate_adjacency_matrix(trap_map.left, matrix, num_begin_points, num_end_points, num_lines)
-        populate_adjacency_matrix(trap_map.right, matrix, num_begin_points, num_end_points, num_lines)
-    elif isinstance(trap_map, EndPoint):
-        # Get Base index of current node
-        base_index = int(trap_map.name[1:]) + num_begin_points - 1
-        # Get Left Child Index
-        if isinstance(trap_map.left, BeginPoint):
-            left_index = int(trap_map.left.name[1:]) - 1
-        elif isinstance(trap_map.left, EndPoint):
-            left_index = int(trap_map.left.name[1:]) + num_begin_points - 1
-        elif isinstance(trap_map.left, Segment):
-            left_index = int(trap_map.left.name[1:]) + num_begin_points + num_end_points - 1
-        else:
-            left_index = int(trap_map.left.name[1:]) + num_begin_points + num_end_points + num_lines - 1
-        # Get Right Child Index
-        if isinstance(trap_map.right, BeginPoint):
-            right_index = int(trap_map.right.name[1:]) - 1
-        elif isinstance(trap_map.right, EndPoint):
-            right_index = int(trap_map.right.name[1:]) + num_begin_points - 1
-        elif isinstance(trap_map.right, Segment):
-            right_index = int(trap_map.right.name[1:]) + num_begin_points + num_end_points - 1
-        else:
-            right_index = int(trap_map.right.name[1:]) + num_begin_points + num_end_points + num_lines - 1
+        stack.append(second)
+        stack.append(first)
 
-        # Update Adjacency Matrix
-        matrix[left_index][base_index] = 1
-        matrix[right_index][base_index] = 1
-        # Traverse down to the children
-        populate_adjacency_matrix(trap_map.left, matrix, num_begin_points, num_end_points, num_lines)
-        populate_adjacency_matrix(trap_map.right, matrix, num_begin_points, num_end_points, num_lines)
-    elif isinstance(trap_map, Segment):
-        # Get Base index of current node
-        base_index = int(trap_map.name[1:]) + num_begin_points + num_end_points - 1
-        # Get Above Child Index
-        if isinstance(trap_map.above, BeginPoint):
-            above_index = int(trap_map.above.name[1:]) - 1
-        elif isinstance(trap_map.above, EndPoint):
-            above_index = int(trap_map.above.name[1:]) + num_begin_points - 1
-        elif isinstance(trap_map.above, Segment):
-            above_index = int(trap_map.above.name[1:]) + num_begin_points + num_end_points - 1
-        else:
-            above_index = int(trap_map.above.name[1:]) + num_begin_points + num_end_points + num_lines - 1
-        # Get Below Child Index
-        if isinstance(trap_map.below, BeginPoint):
-            below_index = int(trap_map.below.name[1:]) - 1
-        elif isinstance(trap_map.below, EndPoint):
-            below_index = int(trap_map.below.name[1:]) + num_begin_points - 1
-        elif isinstance(trap_map.below, Segment):
-            below_index = int(trap_map.below.name[1:]) + num_begin_points + num_end_points - 1
-        else:
-            below_index = int(trap_map.below.name[1:]) + num_begin_points + num_end_points + num_lines - 1
-        
-        # Update Adjacency Matrix
-        matrix[above_index][base_index] = 1
-        matrix[below_index][base_index] = 1
+def adjacency_matrix_rows(row_bits, row_format):
+    """
+    Yields each row of the adjacency matrix as a line of output, followed by its row sum.
+
+    Parameters:
+        row_bits (list): int bitset of each row, bit j set for column j
+        row_format (str): format spec giving the binary width of a row
+
+    Returns:
+        generator: one line of output per row
+    """
+    for bits in row_bits:
+        # Reverse the binary string so column 0 comes first
+        yield " ".join(format(bits, row_format)[::-1]) + " " + str(bin(bits).count("1")) + "\n"
 
-        # Traverse down to the children
-        populate_adjacency_matrix(trap_map.above, matrix, num_begin_points, num_end_points, num_lines)
-        populate_adjacency_matrix(trap_map.below, matrix, num_begin_points, num_end_points, num_lines)
-    
 def create_adjacency_matrix(trap_map, num_lines):
     """
     Calls a number of helper functions to name trapezoids, construct an adjacency matrix, and then write the
     matrix contents to a file.
     """
     # Parse trap map to get total num of trapezoids
-    num_begin_points, num_end_points, num_traps = name_and_count_traps(trap_map, [], 0, 0, 0)
+    num_begin_points, num_end_points, num_traps = name_and_count_traps(trap_map, {}, 0, 0, 0)
     matrix_dim = num_begin_points + num_end_points + num_traps + num_lines
-    matrix = [[0 for x in range(matrix_dim)] for y in range(matrix_dim)] 
-    # Populate matrix with adjacency values
-    populate_adjacency_matrix(trap_map, matrix, num_begin_points, num_end_points, num_lines)
-    # print matrix to file
-    fp = open("output.txt", "w")
-    row_sum = 0
-    col_sum = 0
-    col_sums = []
-    row_str = ""
-    for i in range(0, matrix_dim):
-        row_sum = 0
-        col_sum = 0
-        row_str = ""
-        for j in range(0, matrix_dim):
-            row_sum += int(matrix[i][j])
-            row_str += str(matrix[i][j]) + " "
-        for j in range(0, matrix_dim):
-            col_sum += int(matrix[j][i])
-        col_sums.append(col_sum)
-        row_str += str(row_sum)
-        print(row_str, file=fp)
-    row_str = ""
-    for i in range(0, matrix_dim):
-        row_str += str(col_sums[i]) + " "
-    print(row_str, file=fp)
-
-    fp.close()
+    # Each row of the matrix is kept as an int bitset, bit j set for column j
+    edges = set()
+    populate_adjacency_matrix(trap_map, edges, num_begin_points, num_end_points, num_lines)
+    row_bits = [0] * matrix_dim
+    col_sums = [0] * matrix_dim
+    for row, col in edges:
+        row_bits[row] |= 1 << col
+        col_sums[col] += 1
+    # Write every row of the matrix (with its row sum), then the column sums
+    row_format = "0" + str(matrix_dim) + "b"
+    with open("output.txt", "w") as fp:
+        fp.writelines(adjacency_matrix_rows(row_bits, row_format))
+        fp.write((" ".join(map(str, col_sums)) + " " if col_sums else "") + "\n")
     
 def cli_point_locate_prompt(trap_map):
     """
@@ -887,6 +1005,7 @@ def cli_point_locate_prompt(trap_map):
     in the acyclic graph representation of the trapezoidal map is returned to the user.
     """
     exit_commands = ["quit", "q", "exit", "e"]
+    kind, x, y, dx, dy, child0, child1, nodes = finalize_tree(trap_map)
     while True:
         # Parse input
         try:
@@ -896,17 +1015,12 @@ def cli_point_locate_prompt(trap_map):
                 if len(point) != 2:
                     print("Error parsing point data, incorrect number of coordinates specified. Expected: x y")
                 else:
+                    px, py = point
                     result_path = []
-                    result_str = ""
-                    trap = locate_point(point, trap_map)
-                    result_path.append(trap.name)
-                    while trap.parent != None:
-                        trap = trap.parent
-                        result_path.append(trap.name)
-                    result_path.reverse()
-                    for node in result_path:
-                        result_str += node + " "
-                    print(result_str)
+                    if locate_point_flat(px, py, kind, x, y, dx, dy, child0, child1, result_path) < 0:
+                        print("Error, point could not be located")
+                    else:
+                        print("".join([nodes[node_id].name + " " for node_id in result_path]))
             else:
                 break
         except Exception:
@@ -920,77 +1034,209 @@ def locate_point(point, trap_map):
     """
     Given a point, this function traverses the trapezoidal map, finding the trapezoid the point is in
     """
-    if trap_map == None:
-        print("Error: Trap Map is None")
-        return
-
-    elif isinstance(trap_map, BeginPoint) or isinstance(trap_map, EndPoint):
-        # Check to see if point is to the left or right of the given point
-        if point[0] == trap_map.loc[0]:
-            if point[1] == trap_map.loc[1]:
+    px = point[0]
+    py = point[1]
+    while True:
+        # Identity check, == would call the node's __eq__ on every step
+        if trap_map is None:
+            print("Error: Trap Map is None")
+            return
+
+        # Segment tests come first, they make up most of the nodes on a search path
+        kind = trap_map.KIND
+        if kind == KIND_SEG:
+            # Check to see if point is above or below the given segment, Segment.side inlined
+            p = trap_map.p
+            if trap_map.dx*(py - p.y) - trap_map.dy*(px - p.x) >= 0:
+                trap_map = trap_map.above
+            else:
+                trap_map = trap_map.below
+
+        elif kind <= KIND_EP:
+            # Check to see if point is to the left or right of the given point
+            x = trap_map.x
+            if px > x:
+                trap_map = trap_map.right
+            elif px < x:
+                trap_map = trap_map.left
+            elif py == trap_map.y:
                 # A duplicate point? Return that bad boy!
                 return trap_map
             else:
-                return locate_point(point, trap_map.left)
-        elif point[0] < trap_map.loc[0]:
-            return locate_point(point, trap_map.left)
+                trap_map = trap_map.left
+
+        elif kind == KIND_TRAP:
+            return trap_map
+        
         else:
-            return locate_point(point, trap_map.right)
+            print("Error, unknown node type")
+            return
+
+def finalize_tree(root):
+    """
+    Flattens a finished trapezoidal map into parallel lists indexed by node id (the root is id 0),
+    so point location can walk integer indices instead of chasing node objects.
+    Point nodes store their x and y, segment nodes store the x and y of their left end point p
+    and their dx and dy (q - p), point nodes leave dx and dy at 0. Slot 0 of the children holds
+    left/above and slot 1 holds right/below, a missing child is stored as -1.
 
-    elif isinstance(trap_map, Segment):
-        # Check to see if point is above or below the given segment
-        if point[1] >= trap_map.getY(point[0]):
-            return locate_point(point, trap_map.above)
+    Parameters:
+        root (BeginPoint, EndPoint, Segment, or Trapezoid): root node of the trapezoidal map
+
+    Returns:
+        tuple: (kind, x, y, dx, dy, child0, child1, nodes) where nodes maps an id back to its node
+    """
+    kind = []
+    x = []
+    y = []
+    dx = []
+    dy = []
+    child0 = []
+    child1 = []
+    nodes = []
+    ids = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node is None or id(node) in ids:
+            continue
+        ids[id(node)] = len(nodes)
+        nodes.append(node)
+        node_kind = node.KIND
+        kind.append(node_kind)
+        if node_kind <= KIND_EP:
+            x.append(node.x)
+            y.append(node.y)
+            dx.append(0.0)
+            dy.append(0.0)
+            stack.append(node.right)
+            stack.append(node.left)
+        elif node_kind == KIND_SEG:
+            x.append(node.p.x)
+            y.append(node.p.y)
+            dx.append(node.dx)
+            dy.append(node.dy)
+            stack.append(node.below)
+            stack.append(node.above)
         else:
-            return locate_point(point, trap_map.below)
+            x.append(0.0)
+            y.append(0.0)
+            dx.append(0.0)
+            dy.append(0.0)
+
+    # Children are linked once every node has an id
+    for node in nodes:
+        node_kind = node.KIND
+        if node_kind <= KIND_EP:
+            child0.append(ids.get(id(node.left), -1))
+            child1.append(ids.get(id(node.right), -1))
+        elif node_kind == KIND_SEG:
+            child0.append(ids.get(id(node.above), -1))
+            child1.append(ids.get(id(node.below), -1))
+        else:
+            child0.append(-1)
+            child1.append(-1)
 
-    elif isinstance(trap_map, Trapezoid):
-        return trap_map
-    
-    else:
-        print("Error, unknown node type")
+    return kind, x, y, dx, dy, child0, child1, nodes
 
-def set_figure_size(bounding_box):
+def locate_point_batch(points, flat_map):
     """
-    Sets the size of the plot displayed to the bounding box of the trapezoidal map
+    Locates a batch of points in a flattened trapezoidal map (see finalize_tree), following the same
+    rules as locate_point. A point that matches an existing end point stops on that point's node.
+
+    Parameters:
+        points (list): list of [x, y] query points
+        flat_map (tuple): flattened trapezoidal map returned by finalize_tree
+
+    Returns:
+        list: node id reached by each query point, -1 if the walk fell off a missing child
     """
-    axes = plt.gca()
-    axes.set_xlim([bounding_box[0][0], bounding_box[1][0]])
-    axes.set_ylim([bounding_box[0][1], bounding_box[1][1]])
+    kind, x, y, dx, dy, child0, child1, nodes = flat_map
+    return [locate_point_flat(px, py, kind, x, y, dx, dy, child0, child1) for px, py in points]
 
-def add_line_to_plot(line):
+def locate_point_flat(px, py, kind, x, y, dx, dy, child0, child1, path = None):
     """
-    Adds a line to the plot
+    Descends the flattened trapezoidal map for a single point. Only plain numbers and lists
+    are touched in the loop, no node objects or method calls. When a path list is given, the id of
+    every node visited is appended to it on the way down, so the search path does not have to be
+    rebuilt from parent pointers afterwards.
+
+    Parameters:
+        px (float): x coordinate of the query point
+        py (float): y coordinate of the query point
+        kind, x, y, dx, dy, child0, child1 (list): parallel lists returned by finalize_tree
+        path (list): optional list that collects the ids of the nodes visited, root first
+
+    Returns:
+        int: node id reached by the query point, -1 if the walk fell off a missing child
     """
-    plt.plot([line.p.loc[0], line.q.loc[0]], [line.p.loc[1], line.q.loc[1]], 'b-')
+    cur = 0
+    while cur >= 0:
+        if path is not None:
+            path.append(cur)
+        k = kind[cur]
+        if k <= KIND_EP:
+            point_x = x[cur]
+            if px > point_x:
+                cur = child1[cur]
+            elif px < point_x or py != y[cur]:
+                cur = child0[cur]
+            else:
+                return cur
+        elif k == KIND_SEG:
+            cur = child0[cur] if dx[cur]*(py - y[cur]) - dy[cur]*(px - x[cur]) >= 0 else child1[cur]
+        else:
+            return cur
+    return cur
 
-def add_point_and_bullets_to_plot(point):
+def set_figure_size(bounding_box):
     """
-    Adds a point and its corresponding trimmed bullet paths to the plot
+    Sets the size of the plot displayed to the bounding box of the trapezoidal map
     """
-    # point
-    plt.plot(point.loc[0], point.loc[1], 'bo', markersize=3)
-     # upper bullet
-    plt.plot([point.loc[0], point.loc[0]], [point.loc[1], point.bullet_upper], linestyle="--", color="tab:orange")
-    # lower bullet
-    plt.plot([point.loc[0], point.loc[0]], [point.loc[1], point.bullet_lower], linestyle="--", color="tab:orange")
+    import matplotlib.pyplot as plt
+    axes = plt.gca()
+    axes.set_xlim([bounding_box[0][0], bounding_box[1][0]])
+    axes.set_ylim([bounding_box[0][1], bounding_box[1][1]])
 
 def create_plot_from_trap_map(trap_map, line_set):
     """
-    Creates a displayed plot of the entire trapezoidal map
+    Creates a displayed plot of the entire trapezoidal map. Segments, bullet paths, and points are
+    gathered in a single walk and drawn as one artist each
     """
-    if isinstance(trap_map, BeginPoint) or isinstance(trap_map, EndPoint):
-        # Add point to plot
-        add_point_and_bullets_to_plot(trap_map)
-        create_plot_from_trap_map(trap_map.left, line_set)
-        create_plot_from_trap_map(trap_map.right, line_set)
-    elif isinstance(trap_map, Segment):
-        # Add segment to plot/line_set, check to see if segment already added
-        if trap_map not in line_set:
-            add_line_to_plot(trap_map)
-            line_set.append(trap_map)
-        create_plot_from_trap_map(trap_map.above, line_set)
-        create_plot_from_trap_map(trap_map.below, line_set)
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+    segments = []
+    bullets = []
+    point_x = []
+    point_y = []
+    stack = [trap_map]
+    while stack:
+        cur = stack.pop()
+        if cur is None:
+            continue
+        kind = cur.KIND
+        if kind <= KIND_EP:
+            # Add point and its upper and lower bullets
+            x = cur.x
+            y = cur.y
+            point_x.append(x)
+            point_y.append(y)
+            bullets.append([(x, y), (x, cur.bullet_upper)])
+            bullets.append([(x, y), (x, cur.bullet_lower)])
+            stack.append(cur.right)
+            stack.append(cur.left)
+        elif kind == KIND_SEG:
+            # Add segment to plot/line_set, check to see if segment already added
+            if cur not in line_set:
+                segments.append([(cur.p.x, cur.p.y), (cur.q.x, cur.q.y)])
+                line_set.add(cur)
+            stack.append(cur.below)
+            stack.append(cur.above)
+
+    axes = plt.gca()
+    axes.add_collection(LineCollection(segments, colors="b"))
+    axes.add_collection(LineCollection(bullets, colors="tab:orange", linestyles="--"))
+    plt.plot(point_x, point_y, 'bo', markersize=3)
 
 def construct_map_plot(trap_map, bound_box):
     """
@@ -998,11 +1244,18 @@ def construct_map_plot(trap_map, bound_box):
     Message shown if display is not avaliable.
     """
     try:
-        set_figure_size(bound_box)
-        create_plot_from_trap_map(trap_map, [])
-        plt.show()
-    except:
+        import matplotlib
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is required for plotting. Not displaying pyplot")
+        return
+    # matplotlib falls back to a non-interactive backend when there is no display
+    if matplotlib.get_backend().lower() in NON_INTERACTIVE_BACKENDS:
         print("No display avaliable. Not displaying pyplot")
+        return
+    set_figure_size(bound_box)
+    create_plot_from_trap_map(trap_map, set())
+    plt.show()
 
 def print_usage():
     """
@@ -1016,16 +1269,17 @@ def parseInput(filename):
     """
     with open(filename) as f:
         num_lines = int(f.readline().rstrip())
-        vals = [int(s) for s in str.split(f.readline().rstrip(), ' ')]
+        vals = list(map(int, f.readline().rstrip().split(' ')))
         bound_box = [[vals[0], vals[1]],[vals[2], vals[3]]]
         lines = []
+        append = lines.append
         for line in f:
             if len(line) > 2:
-                vals = [int(s) for s in str.split(line.rstrip(), " ")]
+                vals = list(map(int, line.rstrip().split(" ")))
                 if vals[0] < vals[2]:
-                    lines.append( [[vals[0], vals[1]], [vals[2], vals[3]]] )
+                    append( [[vals[0], vals[1]], [vals[2], vals[3]]] )
                 else:
-                    lines.append( [[vals[2], vals[3]], [vals[0], vals[1]]] )
+                    append( [[vals[2], vals[3]], [vals[0], vals[1]]] )
 
     return num_lines, bound_box, lines
 